@@ -804,6 +804,20 @@ class _Subwindow(object):
 
     return x
 
+  def clear_line(self, y):
+    """
+    Blanks a line of the subwindow.
+
+    :param int y: vertical location
+    """
+
+    if self.height > y:
+      try:
+        self._curses_subwindow.move(y, 0)
+        self._curses_subwindow.clrtoeol()
+      except:
+        pass
+
   def addstr_wrap(self, x, y, msg, width, min_x = 0, *attr):
     """
     Draws a string in the subwindow, with text wrapped if it exceeds a width.
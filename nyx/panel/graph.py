@@ -14,8 +14,10 @@ Downloaded (0.0 B/sec):           Uploaded (0.0 B/sec):
          25s  50   1m   1.6  2.0           25s  50   1m   1.6  2.0
 """
 
+import collections
 import copy
 import functools
+import itertools
 import threading
 import time
 
@@ -27,9 +29,21 @@ import nyx.tracker
 from nyx import nyx_interface, tor_controller, join, show_message
 from nyx.curses import RED, GREEN, CYAN, BOLD, HIGHLIGHT
 from nyx.menu import MenuItem, Submenu, RadioMenuItem, RadioGroup
-from stem.control import EventType, Listener
+from stem.control import EventType, Listener, State
 from stem.util import conf, enum, log, str_tools, system
 
+try:
+  # added in python 3.2
+  from functools import lru_cache
+except ImportError:
+  from stem.util.lru_cache import lru_cache
+
+try:
+  # added in python 3.3
+  from time import monotonic
+except ImportError:
+  from time import time as monotonic
+
 GraphStat = enum.Enum(('BANDWIDTH', 'bandwidth'), ('CONNECTIONS', 'connections'), ('SYSTEM_RESOURCES', 'resources'))
 Interval = enum.Enum(('EACH_SECOND', 'each second'), ('FIVE_SECONDS', '5 seconds'), ('THIRTY_SECONDS', '30 seconds'), ('MINUTELY', 'minutely'), ('FIFTEEN_MINUTE', '15 minute'), ('THIRTY_MINUTE', '30 minute'), ('HOURLY', 'hourly'), ('DAILY', 'daily'))
 Bounds = enum.Enum(('GLOBAL_MAX', 'global_max'), ('LOCAL_MAX', 'local_max'), ('TIGHT', 'tight'))
@@ -93,11 +107,11 @@ def _bandwidth_title_stats():
 
   stats = []
   bw_rate = controller.get_effective_rate(None)
-  bw_burst = controller.get_effective_rate(None, burst = True)
+  bw_burst = controller.get_effective_rate(None, burst = True) if bw_rate else None  # only shown alongside our rate
 
   if bw_rate and bw_burst:
-    bw_rate_label = _size_label(bw_rate)
-    bw_burst_label = _size_label(bw_burst)
+    bw_rate_label = _size_label(bw_rate, cache = True)
+    bw_burst_label = _size_label(bw_burst, cache = True)
 
     # if both are using rounded values then strip off the '.0' decimal
 
@@ -112,7 +126,7 @@ def _bandwidth_title_stats():
   observed_bw = getattr(my_server_descriptor, 'observed_bandwidth', None)
 
   if observed_bw:
-    stats.append('observed: %s/s' % _size_label(observed_bw))
+    stats.append('observed: %s/s' % _size_label(observed_bw, cache = True))
 
   return stats
 
@@ -124,7 +138,7 @@ class GraphData(object):
   :var int latest_value: last value we recorded
   :var int total: sum of all values we've recorded
   :var int tick: number of events we've processed
-  :var dict values: mapping of intervals to an array of samplings from newest to oldest
+  :var dict values: mapping of intervals to a deque of samplings from newest to oldest
   """
 
   def __init__(self, clone = None, category = None, is_primary = True):
@@ -132,7 +146,7 @@ class GraphData(object):
       self.latest_value = clone.latest_value
       self.total = clone.total
       self.tick = clone.tick
-      self.values = copy.deepcopy(clone.values)
+      self.values = dict([(i, copy.copy(values)) for i, values in clone.values.items()])  # deque's copy is atomic, unlike iterating it
 
       self._category = category
       self._is_primary = clone._is_primary
@@ -142,7 +156,7 @@ class GraphData(object):
       self.latest_value = 0
       self.total = 0
       self.tick = 0
-      self.values = dict([(i, CONFIG['max_graph_width'] * [0]) for i in Interval])
+      self.values = dict([(i, collections.deque(CONFIG['max_graph_width'] * [0], CONFIG['max_graph_width'])) for i in Interval])
 
       self._category = category
       self._is_primary = is_primary
@@ -157,13 +171,12 @@ class GraphData(object):
     self.total += new_value
     self.tick += 1
 
-    for interval in Interval:
-      interval_seconds = INTERVAL_SECONDS[interval]
+    for interval, interval_seconds in INTERVAL_SECONDS.items():
       self._in_process_value[interval] += new_value
 
       if self.tick % interval_seconds == 0:
         new_entry = self._in_process_value[interval] / interval_seconds
-        self.values[interval] = [new_entry] + self.values[interval][:-1]
+        self.values[interval].appendleft(new_entry)  # bounded, so this drops our oldest entry
         self._max_value[interval] = max(self._max_value[interval], new_entry)
         self._in_process_value[interval] = 0
 
@@ -190,20 +203,28 @@ class GraphData(object):
     """
 
     min_bound, max_bound = 0, 0
-    values = self.values[interval][:columns]
 
     if bounds == Bounds.GLOBAL_MAX:
-      max_bound = self._max_value[interval]
-    elif columns > 0:
-      max_bound = max(values)  # local maxima
+      return min_bound, self._max_value[interval]
+    elif columns <= 0:
+      return min_bound, max_bound
+
+    # only the window being displayed is scanned, and for just local maxima we
+    # can do so without copying it
 
-    if bounds == Bounds.TIGHT and columns > 0:
+    values = itertools.islice(self.values[interval], columns)
+
+    if bounds == Bounds.TIGHT:
+      values = list(values)
+      max_bound = max(values)
       min_bound = min(values)
 
       # if the max = min pick zero so we still display something
 
       if min_bound == max_bound:
         min_bound = 0
+    else:
+      max_bound = max(values)  # local maxima
 
     return min_bound, max_bound
 
@@ -234,16 +255,20 @@ class GraphCategory(object):
       self.primary = GraphData(clone.primary, category = self)
       self.secondary = GraphData(clone.secondary, category = self)
       self.start_time = clone.start_time
+      self._start_monotonic = clone._start_monotonic
       self._title_stats = list(clone._title_stats)
       self._primary_header_stats = list(clone._primary_header_stats)
       self._secondary_header_stats = list(clone._secondary_header_stats)
+      self._header_cache = {}
     else:
       self.primary = GraphData(category = self, is_primary = True)
       self.secondary = GraphData(category = self, is_primary = False)
       self.start_time = time.time()
+      self._start_monotonic = monotonic()  # start_time on a clock that won't jump
       self._title_stats = []
       self._primary_header_stats = []
       self._secondary_header_stats = []
+      self._header_cache = {}  # is_primary => (width, header stats, header)
 
   def stat_type(self):
     """
@@ -276,15 +301,26 @@ class GraphCategory(object):
     pass
 
   def _header(self, width, is_primary):
+    stats = self._primary_header_stats if is_primary else self._secondary_header_stats
+
+    # stats are replaced rather than modified when we get new values, so until
+    # then we can reuse our prior header
+
+    cached = self._header_cache.get(is_primary)
+
+    if cached and cached[0] == width and cached[1] is stats:
+      return cached[2]
+
     if is_primary:
       header = CONFIG['attr.graph.header.primary'].get(self.stat_type(), '')
-      header_stats = self._primary_header_stats
     else:
       header = CONFIG['attr.graph.header.secondary'].get(self.stat_type(), '')
-      header_stats = self._secondary_header_stats
 
-    header_stats = join(header_stats, '', width - len(header) - 4).rstrip()
-    return '%s (%s):' % (header, header_stats) if header_stats else '%s:' % header
+    header_stats = join(stats, '', width - len(header) - 4).rstrip()
+    result = '%s (%s):' % (header, header_stats) if header_stats else header + ':'
+    self._header_cache[is_primary] = (width, stats, result)
+
+    return result
 
   def _y_axis_label(self, value, is_primary):
     return str(value)
@@ -292,7 +328,8 @@ class GraphCategory(object):
 
 class BandwidthStats(GraphCategory):
   """
-  Tracks tor's bandwidth usage.
+  Tracks tor's bandwidth usage. Samplings and totals are kept in bytes, the
+  unit both tor and _size_label() use, so they're never rescaled.
   """
 
   def __init__(self, clone = None):
@@ -320,40 +357,51 @@ class BandwidthStats(GraphCategory):
         if is_successful:
           log.info('Bandwidth graph has information for the last %s' % str_tools.time_label(len(bw_entries.split()), is_long = True))
 
-      read_total = controller.get_info('traffic/read', None)
-      write_total = controller.get_info('traffic/written', None)
+      traffic = controller.get_info(['traffic/read', 'traffic/written'], None)
       start_time = system.start_time(controller.get_pid(None))
 
-      if read_total and write_total and start_time:
-        self.primary.total = int(read_total)
-        self.secondary.total = int(write_total)
+      if traffic and start_time:
+        self.primary.total = int(traffic['traffic/read'])
+        self.secondary.total = int(traffic['traffic/written'])
         self.start_time = start_time
+        self._start_monotonic = monotonic() - (time.time() - start_time)
 
   def stat_type(self):
     return GraphStat.BANDWIDTH
 
+  def reset_title(self):
+    """
+    Refreshes our title stats with the next BW event rather than waiting out
+    their update rate.
+    """
+
+    self._title_last_updated = None
+
   def _y_axis_label(self, value, is_primary):
-    return _size_label(value, 0)
+    return _size_label(value, 0, cache = True)
 
   def bandwidth_event(self, event):
     self.primary.update(event.read)
     self.secondary.update(event.written)
 
+    now = monotonic()
+    runtime = max(1, now - self._start_monotonic)  # avoid dividing by zero just after starting
+
     self._primary_header_stats = [
-      '%-14s' % ('%s/sec' % _size_label(self.primary.latest_value)),
-      '- avg: %s/sec' % _size_label(self.primary.total / (time.time() - self.start_time)),
+      '%-14s' % (_size_label(self.primary.latest_value) + '/sec'),
+      '- avg: %s/sec' % _size_label(self.primary.total / runtime),
       ', total: %s' % _size_label(self.primary.total),
     ]
 
     self._secondary_header_stats = [
-      '%-14s' % ('%s/sec' % _size_label(self.secondary.latest_value)),
-      '- avg: %s/sec' % _size_label(self.secondary.total / (time.time() - self.start_time)),
+      '%-14s' % (_size_label(self.secondary.latest_value) + '/sec'),
+      '- avg: %s/sec' % _size_label(self.secondary.total / runtime),
       ', total: %s' % _size_label(self.secondary.total),
     ]
 
-    if not self._title_last_updated or time.time() - self._title_last_updated > TITLE_UPDATE_RATE:
+    if not self._title_last_updated or now - self._title_last_updated > TITLE_UPDATE_RATE:
       self._title_stats = _bandwidth_title_stats()
-      self._title_last_updated = time.time()
+      self._title_last_updated = now
 
 
 class ConnectionStats(GraphCategory):
@@ -368,12 +416,11 @@ class ConnectionStats(GraphCategory):
     inbound_count, outbound_count = 0, 0
 
     controller = tor_controller()
-    or_ports = controller.get_ports(Listener.OR, [])
-    dir_ports = controller.get_ports(Listener.DIR, [])
-    control_ports = controller.get_ports(Listener.CONTROL, [])
+    inbound_ports = set(controller.get_ports(Listener.OR, []) + controller.get_ports(Listener.DIR, []))
+    control_ports = set(controller.get_ports(Listener.CONTROL, []))
 
     for entry in nyx.tracker.get_connection_tracker().get_value():
-      if entry.local_port in or_ports or entry.local_port in dir_ports:
+      if entry.local_port in inbound_ports:
         inbound_count += 1
       elif entry.local_port in control_ports:
         pass  # control connection
@@ -422,6 +469,7 @@ class GraphPanel(nyx.panel.Panel):
 
     self._accounting_stats = None
     self._accounting_stats_paused = None
+    self._accounting_last_updated = None  # monotonic timestamp of our last accounting query
 
     self._stats = {
       GraphStat.BANDWIDTH: BandwidthStats(),
@@ -440,7 +488,7 @@ class GraphPanel(nyx.panel.Panel):
     controller = tor_controller()
     controller.add_event_listener(self._update_accounting, EventType.BW)
     controller.add_event_listener(self._update_stats, EventType.BW)
-    controller.add_status_listener(lambda *args: self.redraw())
+    controller.add_status_listener(self._reset_listener)
 
   def stat_options(self):
     return self._stats.keys()
@@ -502,7 +550,9 @@ class GraphPanel(nyx.panel.Panel):
   def set_paused(self, is_pause):
     if is_pause:
       self._accounting_stats_paused = copy.copy(self._accounting_stats)
-      self._stats_paused = dict([(key, type(self._stats[key])(self._stats[key])) for key in self._stats])
+
+      with self._stats_lock:
+        self._stats_paused = dict([(key, type(self._stats[key])(self._stats[key])) for key in self._stats])
 
   def key_handlers(self):
     def _pick_stats():
@@ -582,16 +632,31 @@ class GraphPanel(nyx.panel.Panel):
   def _update_accounting(self, event):
     if not CONFIG['show_accounting']:
       self._accounting_stats = None
-    elif not self._accounting_stats or time.time() - self._accounting_stats.retrieved >= ACCOUNTING_RATE:
+      return
+
+    now = monotonic()
+
+    if not self._accounting_stats or now - self._accounting_last_updated >= ACCOUNTING_RATE:
       old_accounting_stats = self._accounting_stats
       self._accounting_stats = tor_controller().get_accounting_stats(None)
+      self._accounting_last_updated = now
+      interface = nyx_interface()
 
-      if not nyx_interface().is_paused():
+      if not interface.is_paused():
         # if we either added or removed accounting info then redraw the whole
         # screen to account for resizing
 
         if bool(old_accounting_stats) != bool(self._accounting_stats):
-          nyx_interface().redraw()
+          interface.redraw()
+
+  def _reset_listener(self, controller, event_type, _):
+    if event_type == State.RESET:
+      # tor was reloaded so our bandwidth rates may have changed
+
+      with self._stats_lock:
+        self._stats[GraphStat.BANDWIDTH].reset_title()
+
+    self.redraw()
 
   def _update_stats(self, event):
     with self._stats_lock:
@@ -628,9 +693,12 @@ def _draw_subgraph(subwindow, data, x, width, height, bounds_type, interval, col
   for y, label in y_axis_labels.items():
     subwindow.addstr(x, y, label, color)
 
-  for col in range(columns):
-    column_count = int(data.values[interval][col]) - min_bound
-    column_height = int(min(height - 2, (height - 2) * column_count / (max(1, max_bound) - min_bound)))
+  graph_height = height - 2
+  value_range = max(1, max_bound) - min_bound
+
+  for col, value in enumerate(itertools.islice(data.values[interval], max(0, columns))):
+    column_count = int(value) - min_bound
+    column_height = int(min(graph_height, graph_height * column_count / value_range))
     subwindow.vline(x + col + x_axis_offset + 1, height - column_height, column_height, color, HIGHLIGHT, char = fill_char)
 
 
@@ -709,10 +777,19 @@ def _draw_accounting_stats(subwindow, y, accounting):
     subwindow.addstr(12, y, 'Connection Closed...')
 
 
-def _size_label(byte_count, decimal = 1):
+def _size_label(byte_count, decimal = 1, cache = False):
   """
   Alias for str_tools.size_label() that accounts for if the user prefers bits
-  or bytes.
+  or bytes. Only values that repeat (such as axis labels and rate limits)
+  should be cached, others would just evict labels we'll reuse.
   """
 
-  return str_tools.size_label(byte_count, decimal, is_bytes = not CONFIG['show_bits'], round = True)
+  if cache:
+    return _cached_size_label(byte_count, decimal, not CONFIG['show_bits'])
+  else:
+    return str_tools.size_label(byte_count, decimal, is_bytes = not CONFIG['show_bits'], round = True)
+
+
+@lru_cache(maxsize = 1024)
+def _cached_size_label(byte_count, decimal, is_bytes):
+  return str_tools.size_label(byte_count, decimal, is_bytes = is_bytes, round = True)
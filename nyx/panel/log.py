@@ -375,7 +375,7 @@ def _draw_title(subwindow, event_types, event_filter):
   Panel title with the event types we're logging and our regex filter if set.
   """
 
-  subwindow.addstr(0, 0, ' ' * subwindow.width)  # clear line
+  subwindow.clear_line(0)
   title_comp = list(nyx.log.condense_runlevels(*event_types))
 
   if event_filter.selection():
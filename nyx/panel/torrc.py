@@ -167,7 +167,7 @@ class TorrcPanel(panel.Panel):
 
       new_content_height = y + scroll - 1
 
-    subwindow.addstr(0, 0, ' ' * subwindow.width)  # clear line
+    subwindow.clear_line(0)
     location = ' (%s)' % self._torrc_location if self._torrc_location else ''
     subwindow.addstr(0, 0, 'Tor Configuration File%s:' % location, HIGHLIGHT)
 
@@ -3,6 +3,7 @@ Unit tests for nyx.panel.graph.
 """
 
 import datetime
+import threading
 import unittest
 
 import stem.control
@@ -15,9 +16,9 @@ from test import require_curses
 
 try:
   # added in python 3.3
-  from unittest.mock import patch
+  from unittest.mock import Mock, patch
 except ImportError:
-  from mock import patch
+  from mock import Mock, patch
 
 EXPECTED_BLANK_GRAPH = """
 Download:
@@ -96,6 +97,198 @@ class TestGraphPanel(unittest.TestCase):
 
     self.assertEqual({2: '0', 11: '0'}, nyx.panel.graph._y_axis_labels(12, data.primary, 0, 0))
 
+  def test_update(self):
+    data = nyx.panel.graph.ConnectionStats()
+    max_width = nyx.panel.graph.CONFIG['max_graph_width']
+
+    for value in range(max_width + 5):
+      data.primary.update(value)
+
+    values = data.primary.values[nyx.panel.graph.Interval.EACH_SECOND]
+
+    self.assertEqual(max_width, len(values))
+    self.assertEqual(max_width + 4, values[0])
+    self.assertEqual(5, values[-1])
+
+  def test_clone_while_updating(self):
+    data = nyx.panel.graph.ConnectionStats()
+    done = threading.Event()
+
+    def _update():
+      while not done.is_set():
+        data.primary.update(1)
+
+    update_thread = threading.Thread(target = _update)
+    update_thread.start()
+
+    try:
+      for i in range(300):
+        nyx.panel.graph.ConnectionStats(data)
+    finally:
+      done.set()
+      update_thread.join()
+
+  def test_size_label(self):
+    self.assertEqual('2.0 KB', nyx.panel.graph._size_label(2048, cache = True))
+
+    try:
+      nyx.panel.graph.CONFIG['show_bits'] = True
+      self.assertEqual('16.0 Kb', nyx.panel.graph._size_label(2048, cache = True))
+    finally:
+      nyx.panel.graph.CONFIG['show_bits'] = False
+
+    self.assertEqual('2.0 KB', nyx.panel.graph._size_label(2048, cache = True))
+
+    # uncached labels shouldn't take up room in our cache
+
+    cache_size = nyx.panel.graph._cached_size_label.cache_info().currsize
+    self.assertEqual('1.2 KB', nyx.panel.graph._size_label(1234.5))
+    self.assertEqual(cache_size, nyx.panel.graph._cached_size_label.cache_info().currsize)
+
+  def test_header_cache(self):
+    data = nyx.panel.graph.ConnectionStats()
+    data._primary_header_stats = ['5', ', avg: 3']
+
+    with patch('nyx.panel.graph.join', Mock(wraps = nyx.panel.graph.join)) as join_mock:
+      header = data.primary.header(80)
+      self.assertEqual(1, join_mock.call_count)
+
+      # same width and stats reuses our prior header
+
+      self.assertTrue(header is data.primary.header(80))
+      self.assertEqual(1, join_mock.call_count)
+
+      # either a new width or stats rebuilds it
+
+      data.primary.header(40)
+      self.assertEqual(2, join_mock.call_count)
+
+      data._primary_header_stats = ['6', ', avg: 3']
+      self.assertTrue(data.primary.header(40).endswith('(6, avg: 3):'))
+      self.assertEqual(3, join_mock.call_count)
+
+  def test_bounds(self):
+    data = nyx.panel.graph.ConnectionStats()
+
+    for value in (5, 2, 8, 3):
+      data.primary.update(value)
+
+    interval = nyx.panel.graph.Interval.EACH_SECOND
+
+    self.assertEqual((0, 8), data.primary.bounds(nyx.panel.graph.Bounds.GLOBAL_MAX, interval, 2))
+    self.assertEqual((0, 8), data.primary.bounds(nyx.panel.graph.Bounds.LOCAL_MAX, interval, 3))
+    self.assertEqual((0, 3), data.primary.bounds(nyx.panel.graph.Bounds.LOCAL_MAX, interval, 1))
+    self.assertEqual((2, 8), data.primary.bounds(nyx.panel.graph.Bounds.TIGHT, interval, 3))
+    self.assertEqual((0, 3), data.primary.bounds(nyx.panel.graph.Bounds.TIGHT, interval, 1))
+    self.assertEqual((0, 0), data.primary.bounds(nyx.panel.graph.Bounds.LOCAL_MAX, interval, 0))
+
+  @patch('nyx.panel.graph.monotonic', Mock(return_value = 1000.0))
+  @patch('nyx.panel.graph.tor_controller')
+  def test_bandwidth_header_stats(self, tor_controller_mock):
+    tor_controller_mock().get_info.return_value = None
+    tor_controller_mock().get_effective_rate.return_value = None
+    tor_controller_mock().get_server_descriptor.return_value = None
+
+    stats = nyx.panel.graph.BandwidthStats()
+    stats._start_monotonic = 1005.0  # runtime isn't positive, so averages are over a second
+
+    # header stats seldom repeat, so they shouldn't be cached
+
+    cache_size = nyx.panel.graph._cached_size_label.cache_info().currsize
+    stats.bandwidth_event(Mock(read = 2048, written = 1024))
+    self.assertEqual(cache_size, nyx.panel.graph._cached_size_label.cache_info().currsize)
+
+    self.assertEqual('Download (2.0 KB/sec    - avg: 2.0 KB/sec, total: 2.0 KB):', stats.primary.header(80))
+    self.assertEqual('Upload (1.0 KB/sec    - avg: 1.0 KB/sec, total: 1.0 KB):', stats.secondary.header(80))
+
+    # headers are cached until we get new stats
+
+    self.assertEqual('Download (2.0 KB/sec    - avg: 2.0 KB/sec, total: 2.0 KB):', stats.primary.header(80))
+    stats.bandwidth_event(Mock(read = 4096, written = 1024))
+    self.assertEqual('Download (4.0 KB/sec    - avg: 6.0 KB/sec, total: 6.0 KB):', stats.primary.header(80))
+    self.assertEqual('Download (4.0 KB/sec):', stats.primary.header(30))
+
+  @patch('nyx.panel.graph.GraphPanel.redraw', Mock())
+  @patch('nyx.panel.graph.tor_controller')
+  def test_title_refreshed_on_reset(self, tor_controller_mock):
+    tor_controller_mock().get_info.return_value = None
+    tor_controller_mock().get_effective_rate.return_value = None
+    tor_controller_mock().get_server_descriptor.return_value = None
+
+    panel = nyx.panel.graph.GraphPanel()
+    stats = panel._stats[nyx.panel.graph.GraphStat.BANDWIDTH]
+
+    stats.bandwidth_event(Mock(read = 2048, written = 1024))
+    tor_controller_mock().get_effective_rate.reset_mock()
+
+    stats.bandwidth_event(Mock(read = 2048, written = 1024))
+    self.assertFalse(tor_controller_mock().get_effective_rate.called)  # title stats are cached
+
+    panel._reset_listener(tor_controller_mock(), stem.control.State.RESET, None)
+    stats.bandwidth_event(Mock(read = 2048, written = 1024))
+    self.assertTrue(tor_controller_mock().get_effective_rate.called)
+
+  @patch('nyx.panel.graph.nyx_interface', Mock())
+  @patch('nyx.panel.graph.monotonic')
+  @patch('nyx.panel.graph.tor_controller')
+  def test_accounting_refresh_rate(self, tor_controller_mock, monotonic_mock):
+    tor_controller_mock().get_info.return_value = None
+    get_accounting_stats = tor_controller_mock().get_accounting_stats
+    get_accounting_stats.return_value = Mock()
+
+    monotonic_mock.return_value = 100.0
+    panel = nyx.panel.graph.GraphPanel()
+
+    panel._update_accounting(None)
+    self.assertEqual(1, get_accounting_stats.call_count)
+
+    # no need to query again until our accounting rate has passed
+
+    monotonic_mock.return_value = 100.0 + nyx.panel.graph.ACCOUNTING_RATE - 1
+    panel._update_accounting(None)
+    self.assertEqual(1, get_accounting_stats.call_count)
+
+    monotonic_mock.return_value = 100.0 + nyx.panel.graph.ACCOUNTING_RATE
+    panel._update_accounting(None)
+    self.assertEqual(2, get_accounting_stats.call_count)
+
+    # accounting is dropped without a query when disabled
+
+    try:
+      nyx.panel.graph.CONFIG['show_accounting'] = False
+      monotonic_mock.return_value = 1000.0
+      panel._update_accounting(None)
+
+      self.assertEqual(None, panel._accounting_stats)
+      self.assertEqual(2, get_accounting_stats.call_count)
+    finally:
+      nyx.panel.graph.CONFIG['show_accounting'] = True
+
+  @patch('time.time', Mock(return_value = 1410723608.0))
+  @patch('nyx.panel.graph.monotonic', Mock(return_value = 500.0))
+  @patch('nyx.panel.graph.system.start_time', Mock(return_value = 1410723598.0))
+  @patch('nyx.panel.graph.tor_controller')
+  def test_bandwidth_totals(self, tor_controller_mock):
+    tor_controller_mock().get_info.side_effect = lambda param, default = None: {
+      'bw-event-cache': None,
+      ('traffic/read', 'traffic/written'): {'traffic/read': '5430', 'traffic/written': '2100'},
+    }[param if isinstance(param, str) else tuple(param)]
+
+    stats = nyx.panel.graph.BandwidthStats()
+
+    self.assertEqual(5430, stats.primary.total)
+    self.assertEqual(2100, stats.secondary.total)
+    self.assertEqual(1410723598.0, stats.start_time)
+
+    # tor started ten seconds ago, so averages should be over that runtime
+
+    tor_controller_mock().get_effective_rate.return_value = None
+    tor_controller_mock().get_server_descriptor.return_value = None
+    stats.bandwidth_event(Mock(read = 4810, written = 3020))
+
+    self.assertEqual('Download (4.7 KB/sec    - avg: 1.0 KB/sec, total: 10.0 KB):', stats.primary.header(80))
+    self.assertEqual('Upload (2.9 KB/sec    - avg: 512.0 B/sec, total: 5.0 KB):', stats.secondary.header(80))
+
   @require_curses
   @patch('nyx.panel.graph.tor_controller')
   def test_draw_subgraph_blank(self, tor_controller_mock):
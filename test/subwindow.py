@@ -121,6 +121,16 @@ class TestCurses(unittest.TestCase):
 
     self.assertEqual('01234567890123456...', test.render(_draw).content)
 
+  @require_curses
+  def test_clear_line(self):
+    def _draw(subwindow):
+      subwindow.addstr(0, 0, 'line one')
+      subwindow.addstr(0, 1, 'line two')
+      subwindow.addstr(0, 2, 'line three')
+      subwindow.clear_line(1)
+
+    self.assertEqual('line one\n\nline three', test.render(_draw).content)
+
   @require_curses
   def test_box(self):
     def _draw(subwindow):